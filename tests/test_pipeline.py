@@ -1,7 +1,11 @@
+import hashlib
 import pytest
 
+from datetime import date, datetime, timezone
+
 import tg_sync.actions
 from tg_sync.pipeline import Pipeline, Filter, Action
+from tg_sync.workers import ProcessPool
 
 pytest_plugins = ('pytest_asyncio',)
 
@@ -81,3 +85,125 @@ async def test_exit_pipeline():
 - Action log: level=20"""
 
 
+@pytest.fixture
+def process_pool():
+    pool = ProcessPool.configure(max_workers=1)
+    yield pool
+    pool.shutdown()
+    ProcessPool.instance = None
+
+
+@pytest.mark.asyncio
+async def test_cpu_bound_action(tmp_path, process_pool):
+    pipeline = Pipeline.from_config([
+        {
+            "filters": [
+                { "chat_id": 123 },
+            ],
+            "actions": [
+                { "action": "checksum", "algorithm": "md5" },
+            ]
+        },
+        {
+            "filters": [
+                { "checksum": "0" },
+            ],
+            "actions": [
+                { "action": "log" },
+            ]
+        }
+    ])
+
+    assert repr(await pipeline.filter_pipeline({
+        "chat_id": 123,
+    })) == \
+"""Pipeline:
+- Filter: {'chat_id': 123}, Action checksum: checksum=md5
+- Filter: {'checksum': '0'}, Action log: level=20"""
+
+    path = tmp_path / "file.bin"
+    path.write_bytes(b"data")
+    event = { "chat_id": 123, "saved_path": str(path) }
+    await pipeline.execute(event)
+    assert event["checksum"] == hashlib.md5(b"data").hexdigest()
+
+    event = { "chat_id": 123 }
+    await pipeline.execute(event)
+    assert "checksum" not in event
+
+
+def test_filter_operators():
+    filter = Filter(
+        file_size={ "lt": "200M" },
+        date={ "ge": "2025-01-01", "lt": "2025-02-01" },
+        file_name={ "glob": "*.mp4", "not": { "regex": "tmp-.*" } },
+        type_id={ "not": ["sticker", "gif"] },
+    )
+    event = {
+        "file_size": 100 << 20,
+        "date": datetime(2025, 1, 15, tzinfo=timezone.utc),
+        "file_name": "video.mp4",
+        "type_id": "video",
+    }
+    assert filter.matches(event)
+    assert not filter.matches({ **event, "file_size": 300 << 20 })
+    assert not filter.matches({ **event, "date": datetime(2025, 2, 1, tzinfo=timezone.utc) })
+    assert not filter.matches({ **event, "file_name": "tmp-video.mp4" })
+    assert not filter.matches({ **event, "file_name": None })
+    assert not filter.matches({ **event, "type_id": "gif" })
+    assert filter.matches({ **event, "file_size": Filter.MATCH_POSSIBLE }) is None
+
+    with pytest.raises(ValueError):
+        Filter(file_size={ "less": 1 })
+    with pytest.raises(ValueError):
+        Filter(message_id={ "gt": "abc" })
+    with pytest.raises(ValueError):
+        Filter(date={ "ge": 2025 })
+    assert Filter(message_id={ "gt": "100" }).matches({ "message_id": 101 })
+
+
+def test_filter_bare_date():
+    filter = Filter(date={ "gt": "2025-01-03", "le": date(2025, 1, 5) })
+    assert not filter.matches({ "date": datetime(2025, 1, 3, 23, 59, tzinfo=timezone.utc) })
+    assert filter.matches({ "date": datetime(2025, 1, 4, 0, 0, tzinfo=timezone.utc) })
+    assert filter.matches({ "date": datetime(2025, 1, 5, 12, 0, tzinfo=timezone.utc) })
+    assert not filter.matches({ "date": datetime(2025, 1, 6, 0, 0, tzinfo=timezone.utc) })
+    assert Filter(date=date(2025, 1, 5)).matches({ "date": datetime(2025, 1, 5, 12, 0, tzinfo=timezone.utc) })
+    assert filter.get_range("date") == (datetime(2025, 1, 3), datetime(2025, 1, 6))
+
+
+@pytest.mark.asyncio
+async def test_pipeline_range():
+    pipeline = Pipeline.from_config([
+        {
+            "filters": [
+                { "chat_id": 123, "message_id": { "gt": 100 } },
+                { "chat_id": 456, "message_id": [ 50, 60 ] },
+                { "chat_id": 456, "message_id": { "ge": 70, "le": 80 } },
+            ],
+            "actions": [
+                { "action": "log" },
+            ]
+        },
+    ])
+    assert (await pipeline.filter_pipeline({ "chat_id": 123 })).get_range("message_id") == (100, None)
+    assert (await pipeline.filter_pipeline({ "chat_id": 456 })).get_range("message_id") == (50, 80)
+    assert pipeline.get_range("message_id") == (50, None)
+    assert pipeline.get_range("date") == (None, None)
+
+    pipeline = Pipeline.from_config([
+        {
+            "filters": [
+                { "message_id": { "gt": 100 } },
+            ],
+            "actions": [
+                { "action": "set", "save_media": True },
+            ]
+        },
+        {
+            "actions": [
+                { "action": "log" },
+            ]
+        },
+    ])
+    assert (await pipeline.filter_pipeline({ "chat_id": 123 })).get_range("message_id") == (None, None)
@@ -0,0 +1,68 @@
+import asyncio
+import importlib.util
+import os
+import pytest
+import signal
+import yaml
+
+from pathlib import Path
+from types import SimpleNamespace
+
+pytest_plugins = ('pytest_asyncio',)
+
+spec = importlib.util.spec_from_file_location("tg_sync_main", Path(__file__).parent.parent / "tg-sync.py")
+tg_sync_main = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(tg_sync_main)
+
+
+class FakeSession:
+    def __init__(self):
+        self.pipelines = []
+
+    async def set_pipeline(self, pipeline):
+        self.pipelines.append(pipeline)
+
+
+def write_config(path, steps, mtime):
+    path.write_text(yaml.dump({ "pipeline": steps }))
+    os.utime(path, (mtime, mtime))
+
+
+async def wait_for_pipelines(sessions, count):
+    for _ in range(100):
+        if all(len(session.pipelines) >= count for session in sessions):
+            return
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_watch_config(tmp_path):
+    config_path = tmp_path / "config.yaml"
+    write_config(config_path, [ { "actions": [ { "action": "log" } ] } ], mtime=1000)
+    params = SimpleNamespace(config=str(config_path), reload_interval=0.01)
+    sessions = [FakeSession(), FakeSession()]
+
+    task = asyncio.create_task(tg_sync_main.watch_config(params, sessions))
+    try:
+        await asyncio.sleep(0.05)
+        assert all(not session.pipelines for session in sessions)
+
+        write_config(config_path, [ { "actions": [ { "action": "exit" } ] } ], mtime=2000)
+        await wait_for_pipelines(sessions, 1)
+        for session in sessions:
+            assert repr(session.pipelines[-1]) == "Pipeline:\n- Action exit"
+
+        # invalid config keeps current pipeline
+        write_config(config_path, [ { "actions": [ { "action": "unknown" } ] } ], mtime=3000)
+        await asyncio.sleep(0.05)
+        assert all(len(session.pipelines) == 1 for session in sessions)
+
+        # SIGHUP reloads config without changes of file
+        write_config(config_path, [ { "actions": [ { "action": "log" } ] } ], mtime=3000)
+        os.kill(os.getpid(), signal.SIGHUP)
+        await wait_for_pipelines(sessions, 2)
+        for session in sessions:
+            assert repr(session.pipelines[-1]) == "Pipeline:\n- Action log: level=20"
+    finally:
+        task.cancel()
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
@@ -0,0 +1,247 @@
+import os
+import pytest
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import telethon as tt
+
+import tg_sync.actions
+from tg_sync.pipeline import Pipeline
+from tg_sync.session import Account, Session
+
+pytest_plugins = ('pytest_asyncio',)
+
+CHAT = tt.types.User(id=123, first_name="Test")
+CHAT_ID = 123
+
+
+class FakeMessage:
+    def __init__(self, id, grouped_id=None, date=None):
+        self.id = id
+        self.grouped_id = grouped_id
+        self.date = date or datetime(2025, 1, 1, tzinfo=timezone.utc)
+        self.text = ""
+        self.fwd_from = None
+        self.forward = None
+        self.file = SimpleNamespace(ext=".jpg", name=None, size=4, mime_type="image/jpeg")
+        for type in ("web_preview", "audio", "gif", "sticker", "video", "video_note", "voice", "document"):
+            setattr(self, type, None)
+        self.photo = True
+
+    def stringify(self):
+        return f"FakeMessage({self.id})"
+
+    async def get_sender(self):
+        return None
+
+
+class FakeTakeout:
+    def __init__(self, client, error):
+        self.client = client
+        self.error = error
+
+    async def __aenter__(self):
+        if self.error:
+            raise self.error
+        return self.client
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class FakeClient:
+    def __init__(self, messages, takeout_error=None):
+        self.messages = {message.id: message for message in messages}
+        self.requests = []
+        self.takeout_error = takeout_error
+        self.takeout_client = None
+        self.iter_params = []
+        self.session = SimpleNamespace(takeout_id=None)
+
+    def takeout(self, finalize=True, *, users=None, chats=None, megagroups=None, channels=None, files=None, max_file_size=None):
+        # serialize the real request to check its arguments
+        bytes(tt.functions.account.InitTakeoutSessionRequest(
+            message_users=users,
+            message_chats=chats,
+            message_megagroups=megagroups,
+            message_channels=channels,
+            files=files,
+            file_max_size=max_file_size,
+        ))
+        if self.session.takeout_id is not None:
+            raise ValueError("Can't send a takeout request while another takeout for the current session still not been finished yet.")
+        self.takeout_client = FakeClient(self.messages.values())
+        return FakeTakeout(self.takeout_client, self.takeout_error)
+
+    async def end_takeout(self, success):
+        self.session.takeout_id = None
+        return True
+
+    async def iter_dialogs(self):
+        yield SimpleNamespace(entity=CHAT)
+
+    async def iter_messages(self, chat, offset_id=0, offset_date=None, max_id=0, reverse=False, **kwargs):
+        self.iter_params.append((offset_id, offset_date, max_id))
+        for message_id in sorted(self.messages):
+            message = self.messages[message_id]
+            # like in Telethon, offset_id has priority over offset_date
+            if not offset_id and offset_date and message.date <= offset_date:
+                continue
+            if message_id > offset_id and (not max_id or message_id < max_id):
+                yield message
+
+    async def get_messages(self, chat_id, ids):
+        self.requests.append(ids)
+        if isinstance(ids, list):
+            return [self.messages[id] for id in ids]
+        return self.messages[ids]
+
+    async def download_media(self, message, file, progress_callback=None):
+        with open(file, "wb") as output:
+            output.write(b"data")
+        return file
+
+
+def make_save_step(tmp_path):
+    return {
+        "actions": [
+            { "action": "save", "save_path": str(tmp_path / "out" / "{message_id}-{album_index}{file_ext}") },
+        ]
+    }
+
+
+def make_session(tmp_path, client):
+    account = Account(id="test", api_id=1, api_hash="hash", workdir=str(tmp_path))
+    pipeline = Pipeline.from_config([make_save_step(tmp_path)])
+    return Session(account, pipeline, client=client)
+
+
+@pytest.mark.asyncio
+async def test_album_history(tmp_path):
+    client = FakeClient([
+        FakeMessage(1),
+        FakeMessage(2, grouped_id=10),
+        FakeMessage(3, grouped_id=10),
+        FakeMessage(4, grouped_id=10),
+        FakeMessage(5),
+    ])
+    session = make_session(tmp_path, client)
+    pipeline = await session._get_chat_pipeline(CHAT)
+    await session._process_chat_history(CHAT, "beginning", pipeline)
+
+    assert sorted(os.listdir(tmp_path / "out")) == [
+        "1-None.jpg", "2-0.jpg", "3-1.jpg", "4-2.jpg", "5-None.jpg",
+    ]
+    assert client.requests == [1, [2, 3, 4], 5]
+    assert session.progress == { CHAT_ID: 5 }
+    assert not session.message_batches
+
+
+@pytest.mark.asyncio
+async def test_takeout_history(tmp_path):
+    client = FakeClient([FakeMessage(1), FakeMessage(2)])
+    session = make_session(tmp_path, client)
+    session.progress = { CHAT_ID: 1 }
+    await session._process_history(None, takeout=True)
+
+    assert client.requests == []
+    assert client.takeout_client.requests == [2]
+    assert session.progress == { CHAT_ID: 2 }
+    assert session.history_client is None
+
+
+@pytest.mark.asyncio
+async def test_takeout_stale_session(tmp_path):
+    client = FakeClient([FakeMessage(1)])
+    client.session.takeout_id = 42
+    session = make_session(tmp_path, client)
+    await session._process_history("beginning", takeout=True)
+
+    assert client.session.takeout_id is None
+    assert client.requests == []
+    assert client.takeout_client.requests == [1]
+
+
+@pytest.mark.asyncio
+async def test_takeout_fallback(tmp_path):
+    client = FakeClient([FakeMessage(1)], takeout_error=tt.errors.TakeoutInitDelayError(request=None, capture=60))
+    session = make_session(tmp_path, client)
+    await session._process_history("beginning", takeout=True)
+
+    assert client.requests == [1]
+    assert client.takeout_client.requests == []
+    assert session.progress == { CHAT_ID: 1 }
+
+
+@pytest.mark.asyncio
+async def test_set_pipeline(tmp_path):
+    client = FakeClient([FakeMessage(1), FakeMessage(2)])
+    session = make_session(tmp_path, client)
+    other_chat = tt.types.User(id=456, first_name="Other")
+    pipeline = await session._get_chat_pipeline(CHAT)
+    assert await session._get_chat_pipeline(other_chat) is not None
+    await session._process_message(client.messages[1], CHAT, pipeline)
+
+    save_step = make_save_step(tmp_path)
+    save_step["actions"][0]["save_path"] = str(tmp_path / "new" / "{message_id}{file_ext}")
+    await session.set_pipeline(Pipeline.from_config([
+        {
+            "filters": [ { "chat_id": 456 } ],
+            "actions": [ { "action": "exit" } ],
+        },
+        save_step,
+    ]))
+    assert session.chat_pipelines[456] is None
+
+    pipeline = await session._get_chat_pipeline(CHAT)
+    await session._process_message(client.messages[2], CHAT, pipeline)
+    assert os.listdir(tmp_path / "out") == ["1-None.jpg"]
+    assert os.listdir(tmp_path / "new") == ["2.jpg"]
+
+
+@pytest.mark.asyncio
+async def test_history_range(tmp_path):
+    client = FakeClient([
+        FakeMessage(id, date=datetime(2025, 1, id, 12, tzinfo=timezone.utc))
+        for id in range(1, 10)
+    ])
+    session = make_session(tmp_path, client)
+    save_step = make_save_step(tmp_path)
+    save_step["filters"] = [
+        { "message_id": { "le": 7 }, "date": { "ge": "2025-01-03", "le": "2025-01-05" } },
+    ]
+    await session.set_pipeline(Pipeline.from_config([save_step]))
+    pipeline = await session._get_chat_pipeline(CHAT)
+    await session._process_chat_history(CHAT, "beginning", pipeline)
+
+    assert client.iter_params == [(0, datetime(2025, 1, 2, 23, 59, 59, tzinfo=timezone.utc), 8)]
+    assert client.requests == [3, 4, 5]
+    assert session.progress == { CHAT_ID: 5 }
+
+
+@pytest.mark.asyncio
+async def test_history_range_from_date(tmp_path):
+    client = FakeClient([
+        FakeMessage(id, date=datetime(2025, 1, id, 12, tzinfo=timezone.utc))
+        for id in range(1, 10)
+    ])
+    session = make_session(tmp_path, client)
+    save_step = make_save_step(tmp_path)
+    save_step["filters"] = [ { "message_id": { "gt": 2 } } ]
+    await session.set_pipeline(Pipeline.from_config([save_step]))
+    pipeline = await session._get_chat_pipeline(CHAT)
+    await session._process_chat_history(CHAT, "2025-01-07T00:00:00+00:00", pipeline)
+
+    assert client.iter_params == [(0, datetime(2025, 1, 7, tzinfo=timezone.utc), 0)]
+    assert client.requests == [7, 8, 9]
+
+    client = FakeClient(client.messages.values())
+    session = make_session(tmp_path, client)
+    save_step["filters"] = [ { "message_id": { "gt": 2 }, "date": { "ge": "2025-01-08" } } ]
+    await session.set_pipeline(Pipeline.from_config([save_step]))
+    pipeline = await session._get_chat_pipeline(CHAT)
+    await session._process_chat_history(CHAT, "2025-01-07T00:00:00+00:00", pipeline)
+
+    assert client.iter_params == [(0, datetime(2025, 1, 7, 23, 59, 59, tzinfo=timezone.utc), 0)]
+    assert client.requests == [8, 9]
@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+import shutil
+import time
+
+from types import SimpleNamespace
+
+from tg_sync.throttling import DiskGuard, TokenBucket
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket():
+    bucket = TokenBucket(rate=1000, burst=100)
+    start = time.monotonic()
+    await bucket.consume(100)
+    assert time.monotonic() - start < 0.05
+    await bucket.consume(200)
+    assert time.monotonic() - start >= 0.19
+
+
+@pytest.mark.asyncio
+async def test_disk_guard(tmp_path, monkeypatch):
+    free_space = [10]
+    monkeypatch.setattr(shutil, "disk_usage", lambda path: SimpleNamespace(free=free_space[0]))
+    guard = DiskGuard(min_free_space=100, check_interval=0.01)
+
+    async def download():
+        async with guard.reserve(str(tmp_path), 50):
+            await asyncio.sleep(0.05)
+
+    task = asyncio.create_task(download())
+    await asyncio.sleep(0.05)
+    assert not task.done()
+    assert guard.paused_devices
+
+    free_space[0] = 180
+    other_task = asyncio.create_task(download())
+    await asyncio.sleep(0.03)
+    # only one download fits until the other one is finished
+    assert sum(guard.reserved.values()) == 50
+    assert not other_task.done()
+
+    await asyncio.wait_for(asyncio.gather(task, other_task), 1)
+    assert sum(guard.reserved.values()) == 0
+
+
+@pytest.mark.asyncio
+async def test_disk_guard_written(tmp_path, monkeypatch):
+    monkeypatch.setattr(shutil, "disk_usage", lambda path: SimpleNamespace(free=1000))
+    guard = DiskGuard(min_free_space=100)
+
+    async with guard.reserve(str(tmp_path), 300) as reservation:
+        reservation.update(100)
+        assert sum(guard.reserved.values()) == 200
+        reservation.update(300)
+        assert sum(guard.reserved.values()) == 0
+    assert sum(guard.reserved.values()) == 0
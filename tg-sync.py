@@ -5,24 +5,69 @@ import asyncio
 import logging
 import logging.config
 import os
+import signal
 import yaml
 
 import tg_sync.actions
 from tg_sync.event import MEDIA_TYPES
 from tg_sync.pipeline import Pipeline
 from tg_sync.session import Session, Account
+from tg_sync.throttling import Throttling
+from tg_sync.workers import ProcessPool
 
 logger = logging.getLogger("tg_sync")
 
+def load_config(path):
+    with open(path) as file:
+        return yaml.safe_load(file)
+
+
+async def reload_pipeline(params, sessions):
+    try:
+        config = load_config(params.config)
+        pipeline = Pipeline.from_config(config["pipeline"])
+    except Exception:
+        logger.exception("Failed to reload config %s, keeping current pipeline", params.config)
+        return
+    logger.info("Reloaded config %s", params.config)
+    await asyncio.gather(*[session.set_pipeline(pipeline) for session in sessions])
+
+
+async def watch_config(params, sessions):
+    reload_requested = asyncio.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_requested.set)
+    except (AttributeError, NotImplementedError):
+        pass  # no SIGHUP on this platform
+    timeout = params.reload_interval or None
+    mtime = os.stat(params.config).st_mtime
+    while True:
+        try:
+            await asyncio.wait_for(reload_requested.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        try:
+            new_mtime = os.stat(params.config).st_mtime
+        except OSError:
+            # config is being replaced, retry later
+            await asyncio.sleep(1)
+            continue
+        if reload_requested.is_set() or new_mtime != mtime:
+            reload_requested.clear()
+            mtime = new_mtime
+            await reload_pipeline(params, sessions)
+
+
 async def run(params):
-    with open(params.config) as file:
-        config = yaml.safe_load(file)
+    config = load_config(params.config)
 
     log_config = config.get("logging")
     if log_config:
         logging.config.dictConfig(log_config)
 
     pipeline = Pipeline.from_config(config["pipeline"])
+    process_pool = ProcessPool.configure(**(config.get("process_pool") or {}))
+    Throttling.configure(**(config.get("downloads") or {}))
 
     accounts = []
     for account_dir in params.account:
@@ -34,7 +79,7 @@ async def run(params):
 
     try:
         await asyncio.gather(*[
-            session.start(offset=params.offset, live=params.live)
+            session.start(offset=params.offset, live=params.live, takeout=params.takeout)
             for session in sessions
         ])
 
@@ -48,9 +93,10 @@ async def run(params):
                 await session.list_users()
 
         if params.live:
-            await asyncio.Event().wait()
+            await watch_config(params, sessions)
     finally:
         await asyncio.gather(*[session.stop() for session in sessions])
+        process_pool.shutdown()
 
 
 def main():
@@ -67,6 +113,10 @@ def main():
         processed - process chat from the last processed message;
         now - don't process chat history;
         or an ISO 8601 formatted date to process from (e.g. 2025-04-29T00:00:00+07:00)""")
+    parser.add_argument("--reload-interval", type=float, default=5,
+        help="How often (in seconds) to check config for changes in live mode, 0 to reload on SIGHUP only")
+    parser.add_argument("--takeout", action="store_true",
+        help="Use takeout session for processing of chat history (higher limits for bulk export)")
     params = parser.parse_args()
 
     # do no actions on config keys
@@ -1,9 +1,15 @@
+import hashlib
 import logging
 import os
 
-from .event import EVENT_FIELDS
-from .pipeline import Action, Filter, register_action, ExecuteResult
+from datetime import datetime
+
+from PIL import Image, ImageOps
+
+from .event import EVENT_FIELDS, FileField
+from .pipeline import Action, CpuBoundAction, Filter, register_action, ExecuteResult
 from .session import Session
+from .throttling import Throttling
 from .utils import get_uniq_path
 
 logger = logging.getLogger(__name__)
@@ -78,6 +84,7 @@ class SaveAction(Action):
         if self.skip_existing:
             if os.path.exists(save_path) and os.path.getsize(save_path) == event["file_size"]:
                 self.logger.info("Skip downloading existing file %s", save_path)
+                event[FileField.SAVED_PATH] = save_path
                 return ExecuteResult.SKIPPED
 
         save_dir = os.path.dirname(save_path)
@@ -88,10 +95,107 @@ class SaveAction(Action):
             if os.path.exists(old_save_path) and os.path.getsize(old_save_path) == event["file_size"]:
                 os.rename(old_save_path, save_path)
                 self.logger.info("Moved file from old location: %s", save_path)
+                event[FileField.SAVED_PATH] = save_path
                 return None
 
-        session = Session.get(event["account_id"])
-        download_path = await session.download_media(event["chat_id"], event["message_id"])
-        uniq_path = get_uniq_path(save_path)
-        os.rename(download_path, uniq_path)
+        # downloads are renamed to save_path, so they use the same disk
+        async with Throttling.get().reserve_space(save_dir, event["file_size"]) as reservation:
+            session = Session.get(event["account_id"])
+            download_path = await session.download_media(
+                event["chat_id"],
+                event["message_id"],
+                on_progress=reservation and reservation.update,
+            )
+            uniq_path = get_uniq_path(save_path)
+            os.rename(download_path, uniq_path)
         self.logger.info("Saved file %s", uniq_path)
+        event[FileField.SAVED_PATH] = uniq_path
+
+
+def _get_saved_path(event):
+    saved_path = event.get(FileField.SAVED_PATH)
+    return saved_path if saved_path and os.path.exists(saved_path) else None
+
+
+@register_action
+class ChecksumAction(CpuBoundAction):
+    name = "checksum"
+
+    def __init__(self, algorithm: str = "sha256", field: str = "checksum"):
+        hashlib.new(algorithm)  # validate algorithm name
+        self.algorithm = algorithm
+        self.outputs = (field,)
+        super().__init__()
+
+    def __repr__(self):
+        return f"Action {self.name}: {self.outputs[0]}={self.algorithm}"
+
+    def get_args(self, event):
+        saved_path = _get_saved_path(event)
+        return saved_path and (saved_path, self.algorithm, self.outputs[0])
+
+    @staticmethod
+    def compute(path, algorithm, field):
+        digest = hashlib.new(algorithm)
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        return {field: digest.hexdigest()}
+
+
+EXIF_DATE_TIME_ORIGINAL = 0x9003
+EXIF_IFD = 0x8769
+
+
+@register_action
+class ImageInfoAction(CpuBoundAction):
+    name = "image_info"
+    outputs = ("width", "height", "exif_date")
+
+    def get_args(self, event):
+        saved_path = _get_saved_path(event)
+        return saved_path and (saved_path, event.get("date"))
+
+    @staticmethod
+    def compute(path, date):
+        # EXIF date has no timezone, so message date is returned as naive local time too
+        date = date and date.replace(tzinfo=None)
+        try:
+            with Image.open(path) as image:
+                width, height = image.size
+                exif_date = image.getexif().get_ifd(EXIF_IFD).get(EXIF_DATE_TIME_ORIGINAL)
+        except OSError:  # not an image or a broken one
+            return {"width": None, "height": None, "exif_date": date}
+        try:
+            exif_date = datetime.strptime(exif_date, "%Y:%m:%d %H:%M:%S") if exif_date else date
+        except (TypeError, ValueError):
+            exif_date = date
+        return {"width": width, "height": height, "exif_date": exif_date}
+
+
+@register_action
+class ThumbnailAction(CpuBoundAction):
+    name = "thumbnail"
+    outputs = ("thumbnail_path",)
+    modifies_files = True
+
+    def __init__(self, save_path: str, size: int = 320):
+        self.save_path = save_path
+        self.size = size
+        super().__init__()
+
+    def get_args(self, event):
+        saved_path = _get_saved_path(event)
+        return saved_path and (saved_path, self.save_path.format(**event), self.size)
+
+    @staticmethod
+    def compute(path, save_path, size):
+        try:
+            with Image.open(path) as image:
+                thumbnail = ImageOps.exif_transpose(image).convert("RGB")
+                thumbnail.thumbnail((size, size))
+        except OSError:  # not an image or a broken one
+            return {"thumbnail_path": None}
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        thumbnail.save(save_path, "JPEG")
+        return {"thumbnail_path": save_path}
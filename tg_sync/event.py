@@ -22,6 +22,7 @@ class FileField:
     FILE_NAME = "file_name"
     FILE_SIZE = "file_size"
     FILE_TYPE = "file_type"
+    SAVED_PATH = "saved_path"
 
 
 class EventField(ChatField, UserField):
@@ -32,6 +33,8 @@ class EventField(ChatField, UserField):
     DATE = "date"
     DATE_UTC = "date_utc"
     FORWARD = "forward"
+    ALBUM_ID = "album_id"
+    ALBUM_INDEX = "album_index"
 
 
 def _get_fields(cls):
@@ -87,7 +90,7 @@ def _get_message_media_type(message):
     return None
 
 
-def fill_event(message=None, file=None, account=None, chat=None, user=None, fwd_chat=None, fwd_user=None, tzinfo=None):
+def fill_event(message=None, file=None, account=None, chat=None, user=None, fwd_chat=None, fwd_user=None, tzinfo=None, album_index=None):
     event = {}
 
     if message:
@@ -98,6 +101,8 @@ def fill_event(message=None, file=None, account=None, chat=None, user=None, fwd_
             EventField.DATE_UTC: message.date,
             EventField.TEXT: message.text,
             EventField.FORWARD: message.fwd_from is not None,
+            EventField.ALBUM_ID: message.grouped_id,
+            EventField.ALBUM_INDEX: album_index,
         })
     if file:
         event.update({
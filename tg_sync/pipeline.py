@@ -1,19 +1,161 @@
+import fnmatch
 import logging
+import operator
+import re
 
+from datetime import date, datetime, time, timedelta
 from enum import Enum, auto
 from typing import Optional
 
-from .event import EVENT_FIELDS
+from .event import EVENT_FIELDS, EventField, FileField
+from .utils import parse_size
+from .workers import ProcessPool
 
 
 logger = logging.getLogger(__name__)
 
 
+COMPARISON_OPERATORS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "lt": operator.lt,
+    "le": operator.le,
+    "gt": operator.gt,
+    "ge": operator.ge,
+}
+
+DATE_KEYS = (EventField.DATE, EventField.DATE_UTC)
+
+
+def _parse_operand(key, value):
+    if isinstance(value, list):
+        return [_parse_operand(key, item) for item in value]
+    if value is None:
+        return value
+    if key == EventField.MESSAGE_ID:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for '{key}': {value!r}") from None
+    if key == FileField.FILE_SIZE:
+        if isinstance(value, (str, int, float)):
+            return parse_size(value)
+        raise ValueError(f"Invalid value for '{key}': {value!r}")
+    if key in DATE_KEYS:
+        if isinstance(value, date):
+            return value
+        if isinstance(value, str):
+            # bare date (without time) matches the whole day
+            try:
+                return date.fromisoformat(value)
+            except ValueError:
+                pass
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                pass
+        raise ValueError(f"Invalid value for '{key}': {value!r}")
+    return value
+
+
+def _is_bare_date(value) -> bool:
+    return isinstance(value, date) and not isinstance(value, datetime)
+
+
+def _compare(op, actual, expected) -> bool:
+    if actual is None or expected is None:
+        return op(actual, expected) if op in (operator.eq, operator.ne) else False
+    if isinstance(actual, datetime):
+        if _is_bare_date(expected):
+            actual = actual.date()
+        elif isinstance(expected, datetime) and expected.tzinfo is None:
+            expected = expected.replace(tzinfo=actual.tzinfo)
+    return op(actual, expected)
+
+
+def _get_bound(value, upper: bool):
+    if _is_bare_date(value):
+        return datetime.combine(value + timedelta(days=1) if upper else value, time())
+    return value
+
+
+class Condition:
+    """Expected value of a filter key.
+
+    Scalar value is compared for equality, list value is checked for membership.
+    Dict value contains operators (all of them should match):
+    comparison (eq, ne, lt, le, gt, ge), in, glob, regex and not.
+    """
+
+    def __init__(self, key: str, value):
+        self.key = key
+        self.operators = []
+        if isinstance(value, dict):
+            for op, operand in value.items():
+                self._add_operator(op, operand)
+        elif isinstance(value, list):
+            self._add_operator("in", value)
+        else:
+            self._add_operator("eq", value)
+
+    def _add_operator(self, op, operand):
+        if op in COMPARISON_OPERATORS or op == "in":
+            operand = _parse_operand(self.key, operand)
+        elif op == "glob":
+            operand = re.compile(fnmatch.translate(operand))
+        elif op == "regex":
+            operand = re.compile(operand)
+        elif op == "not":
+            operand = Condition(self.key, operand)
+        else:
+            raise ValueError(f"Unknown filter operator '{op}' for key '{self.key}'")
+        self.operators.append((op, operand))
+
+    def _matches_operator(self, op, operand, actual) -> bool:
+        if op in COMPARISON_OPERATORS:
+            return _compare(COMPARISON_OPERATORS[op], actual, operand)
+        if op == "in":
+            return any(_compare(operator.eq, actual, item) for item in operand)
+        if op == "not":
+            return not operand.matches(actual)
+        # glob or regex
+        return actual is not None and operand.fullmatch(str(actual)) is not None
+
+    def matches(self, actual) -> bool:
+        return all(self._matches_operator(op, operand, actual) for op, operand in self.operators)
+
+    def get_range(self) -> tuple:
+        """Returns (low, high) inclusive bounds of matching values, None if not bounded."""
+        low = high = None
+        try:
+            for op, operand in self.operators:
+                if op in ("eq", "in"):
+                    values = operand if op == "in" else [operand]
+                    if not values or None in values:
+                        continue
+                    op_low, op_high = min(values), max(values)
+                elif op in ("gt", "ge") and operand is not None:
+                    op_low, op_high = operand, None
+                elif op in ("lt", "le") and operand is not None:
+                    op_low, op_high = None, operand
+                else:
+                    continue
+                op_low, op_high = _get_bound(op_low, upper=False), _get_bound(op_high, upper=True)
+                if op_low is not None:
+                    low = op_low if low is None else max(low, op_low)
+                if op_high is not None:
+                    high = op_high if high is None else min(high, op_high)
+        except TypeError:
+            return None, None  # dates with and without timezone are not comparable
+        return low, high
+
+
 class Filter:
     MATCH_POSSIBLE = "---tg-sync-match-possible---"
 
     def __init__(self, **values):
         self.values = values
+        self.conditions = {key: Condition(key, value) for key, value in values.items()}
 
     def __repr__(self):
         return f"Filter: {self.values}"
@@ -21,12 +163,12 @@ class Filter:
     def matches_key(self, event, key) -> bool:
         if event.get(key) == Filter.MATCH_POSSIBLE:
             return None
-        actual_value = event.get(key)
-        expected_value = self.values.get(key)
-        if isinstance(expected_value, list):
-            return actual_value in expected_value
-        else:
-            return actual_value == expected_value
+        return self.conditions[key].matches(event.get(key))
+
+    def get_range(self, key) -> tuple:
+        if key not in self.conditions:
+            return None, None
+        return self.conditions[key].get_range()
 
     def matches(self, event: dict) -> bool:
         filter_result = True
@@ -65,12 +207,45 @@ class Action:
         raise RuntimeError("Action.execute should be implemented")
 
 
+class CpuBoundAction(Action):
+    """Action, which computes its results in a worker process.
+
+    `compute` is called in the process pool with arguments returned by `get_args`,
+    and should return dict with `outputs` keys, which are set to event.
+    """
+    outputs: tuple[str, ...] = ()
+    modifies_files = False
+
+    def __init__(self):
+        for key in self.outputs:
+            if key in EVENT_FIELDS:
+                raise ValueError(f"Action '{self.name}' can't override built-in key: '{key}'")
+
+    def get_args(self, event: dict) -> Optional[tuple]:
+        raise RuntimeError("CpuBoundAction.get_args should be implemented")
+
+    @staticmethod
+    def compute(*args) -> dict:
+        raise RuntimeError("CpuBoundAction.compute should be implemented")
+
+    async def execute(self, event, dry_run=False, **kwargs):
+        if dry_run:
+            for key in self.outputs:
+                event[key] = Filter.MATCH_POSSIBLE
+            return ExecuteResult.DRY_RUN if self.modifies_files else None
+        args = self.get_args(event)
+        if args is None:
+            return ExecuteResult.SKIPPED
+        event.update(await ProcessPool.get().run(self.compute, *args))
+
+
 def register_action(action_class):
     action_name = action_class.name
     registered_class = Action.subclasses.get(action_name)
     if registered_class:
         raise ValueError(f"Action '{action_name}' is registered multiple times: {registered_class} and {action_class}")
     Action.subclasses[action_name] = action_class
+    return action_class
 
 
 class ProcessingStep:
@@ -132,8 +307,10 @@ class Pipeline:
     def from_config(steps: list[dict]) -> "Pipeline":
         return Pipeline([ProcessingStep.from_config(**step) for step in steps])
 
-    def __init__(self, steps: list[ProcessingStep]):
+    def __init__(self, steps: list[ProcessingStep], meaningful_steps: list[ProcessingStep] = None):
         self.steps = steps
+        # steps, which produce any result, used to get ranges of matching values
+        self.meaningful_steps = steps if meaningful_steps is None else meaningful_steps
 
     def __repr__(self):
         return f"Pipeline:\n- " + "\n- ".join(repr(step) for step in self.steps)
@@ -153,6 +330,7 @@ class Pipeline:
         }
         event.update(sample_event)
         filtered_steps = []
+        meaningful_steps = []
         has_meaningful_actions = False
         for step in self.steps:
             step_data = await step.filter_step(event)
@@ -161,12 +339,31 @@ class Pipeline:
             filters, actions, has_modify, has_exit = step_data
 
             has_meaningful_actions |= has_modify
-            filtered_steps.append(ProcessingStep(filters, actions))
+            filtered_step = ProcessingStep(filters, actions)
+            filtered_steps.append(filtered_step)
+            if has_modify:
+                meaningful_steps.append(filtered_step)
 
             if has_exit:
                 break
 
         if has_meaningful_actions:
-            return Pipeline(filtered_steps)
+            return Pipeline(filtered_steps, meaningful_steps)
         else:
             return None
+
+    def get_range(self, key) -> tuple:
+        """Returns (low, high) bounds of key values, which may produce any result."""
+        ranges = []
+        for step in self.meaningful_steps:
+            if not step.filters:
+                return None, None
+            ranges.extend(filter.get_range(key) for filter in step.filters)
+        lows = [low for low, high in ranges]
+        highs = [high for low, high in ranges]
+        try:
+            low = None if not lows or None in lows else min(lows)
+            high = None if not highs or None in highs else max(highs)
+        except TypeError:
+            return None, None
+        return low, high
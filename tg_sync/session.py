@@ -1,21 +1,26 @@
 import asyncio
+import contextlib
 import logging
 import os
 import os.path
 import yaml
 
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 import telethon as tt
 
-from .event import fill_event
+from .event import EventField, fill_event
 from .pipeline import Pipeline
-from .utils import get_chat_id, parse_timezone, save_yaml
+from .throttling import Throttling, TokenBucket
+from .utils import get_chat_id, parse_size, parse_timezone, save_yaml
 
 
 logger = logging.getLogger(__name__)
 
+# max size of files to download through takeout session (Telegram limit for premium accounts)
+TAKEOUT_MAX_FILE_SIZE = 4 << 30
+
 
 @dataclass
 class Account:
@@ -27,11 +32,28 @@ class Account:
     password: str = None
     bot_token: str = None
     timezone: str = None
+    rate_limit: str = None
 
     def __repr__(self):
         return f"Account {self.id}"
 
 
+class MessageBatch:
+    """Messages of one album, fetched lazily with a single RPC."""
+
+    def __init__(self, client, chat_id: int, message_ids: list[int]):
+        self.client = client
+        self.chat_id = chat_id
+        self.message_ids = message_ids
+        self.task = None
+
+    async def get(self, message_id: int):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.client.get_messages(self.chat_id, ids=self.message_ids))
+        messages = await self.task
+        return messages[self.message_ids.index(message_id)]
+
+
 class Session:
     instances: dict[str, "Session"] = {}
 
@@ -39,11 +61,14 @@ class Session:
     def get(account_id: str) -> "Session":
         return Session.instances[account_id]
 
-    def __init__(self, account: Account, pipeline: Pipeline):
+    def __init__(self, account: Account, pipeline: Pipeline, client=None):
         self.account = account
         self.pipeline = pipeline
         self.chat_pipelines = {}
-        self.client = tt.TelegramClient(
+        self.chat_events = {}
+        self.message_batches: dict[tuple[int, int], MessageBatch] = {}
+        self.history_client = None
+        self.client = client or tt.TelegramClient(
             f"{account.workdir}/{account.id}.session",
             account.api_id,
             account.api_hash,
@@ -61,6 +86,10 @@ class Session:
         if account.timezone:
             self.tzinfo = parse_timezone(account.timezone)
 
+        self.rate_limiter = None
+        if account.rate_limit:
+            self.rate_limiter = TokenBucket(parse_size(account.rate_limit))
+
         Session.instances[account.id] = self
 
     async def _get_chat_pipeline(self, chat):
@@ -69,9 +98,20 @@ class Session:
             return self.chat_pipelines[chat_id]
         sample_event = fill_event(account=self.account, chat=chat)
         chat_pipeline = await self.pipeline.filter_pipeline(sample_event)
+        self.chat_events[chat_id] = sample_event
         self.chat_pipelines[chat_id] = chat_pipeline
         return chat_pipeline
 
+    async def set_pipeline(self, pipeline: Pipeline):
+        # Already running pipelines keep references to the old steps,
+        # so in-flight events are finished with the old configuration.
+        chat_pipelines = {}
+        for chat_id, sample_event in list(self.chat_events.items()):
+            chat_pipelines[chat_id] = await pipeline.filter_pipeline(sample_event)
+        self.pipeline = pipeline
+        self.chat_pipelines = chat_pipelines
+        logger.info("%s: pipeline updated for %s chats", self.account, len(chat_pipelines))
+
     async def _get_chat_and_pipeline(self, chat_id):
         if chat_id in self.chat_pipelines:
             pipeline = self.chat_pipelines[chat_id]
@@ -82,11 +122,11 @@ class Session:
             pipeline = await self._get_chat_pipeline(chat)
             return chat, pipeline
 
-    async def _process_message(self, message, chat, pipeline):
+    async def _get_message_event(self, message, chat, album_index=None):
         logger.debug("Processing message %s", message.stringify())
         fwd_user = message.forward and await message.forward.get_sender()
         fwd_chat = message.forward and await message.forward.get_chat()
-        event = fill_event(
+        return fill_event(
             message=message,
             file=message.file,
             account=self.account,
@@ -95,11 +135,40 @@ class Session:
             fwd_chat=fwd_chat,
             fwd_user=fwd_user,
             tzinfo=self.tzinfo,
+            album_index=album_index,
         )
-        await pipeline.execute(event)
-        self.progress[event["chat_id"]] = message.id
+
+    async def _save_progress(self, chat_id: int, message_id: int):
+        self.progress[chat_id] = message_id
         await save_yaml(self.progress, self.progress_path)
 
+    async def _process_message(self, message, chat, pipeline):
+        event = await self._get_message_event(message, chat)
+        await pipeline.execute(event)
+        await self._save_progress(event["chat_id"], message.id)
+
+    async def _process_album(self, messages, chat, pipeline):
+        chat_id = get_chat_id(chat)
+        message_ids = [message.id for message in messages]
+        events = [
+            await self._get_message_event(message, chat, album_index=index)
+            for index, message in enumerate(messages)
+        ]
+        batch = MessageBatch(self._get_fetch_client(), chat_id, message_ids)
+        keys = [(chat_id, message_id) for message_id in message_ids]
+        for key in keys:
+            self.message_batches[key] = batch
+        try:
+            await asyncio.gather(*[pipeline.execute(event) for event in events])
+        finally:
+            for key in keys:
+                self.message_batches.pop(key, None)
+        # the album is committed only when all its items are processed
+        await self._save_progress(chat_id, max(message_ids))
+
+    def _get_fetch_client(self):
+        return self.history_client or self.client
+
     async def _process_chat_history(self, chat, offset: str, pipeline: Pipeline):
         offset_id = 0
         offset_date = None
@@ -109,18 +178,91 @@ class Session:
         elif offset != "beginning":
             offset_date = datetime.fromisoformat(offset)
 
-        async for message in self.client.iter_messages(chat, offset_id=offset_id, offset_date=offset_date, reverse=True):
-            await self._process_message(message, chat, pipeline)
+        # skip ranges of messages, which can't match pipeline filters
+        max_id = 0
+        min_message_id, max_message_id = pipeline.get_range(EventField.MESSAGE_ID)
+        # offset_id (and min_id) has priority over offset_date in reverse mode,
+        # so message id bound is not used when starting from a date
+        if min_message_id is not None and offset_date is None:
+            offset_id = max(offset_id, min_message_id - 1)
+        if max_message_id is not None:
+            max_id = max_message_id + 1
+        min_date, max_date = self._get_date_range(pipeline)
+        if min_date is not None and offset_id == 0:
+            min_offset_date = min_date - timedelta(seconds=1)
+            if offset_date is None:
+                offset_date = min_offset_date
+            else:
+                if offset_date.tzinfo is None:
+                    # naive dates are sent as local time
+                    min_offset_date = min_offset_date.astimezone().replace(tzinfo=None)
+                offset_date = max(offset_date, min_offset_date)
 
-    async def _process_history(self, offset: str):
-        tasks = []
-        async for dialog in self.client.iter_dialogs():
-            chat_pipeline = await self._get_chat_pipeline(dialog.entity)
-            if chat_pipeline:
-                tasks.append(self._process_chat_history(dialog.entity, offset, chat_pipeline))
-        await asyncio.gather(*tasks)
+        album = []
+        async for message in self._get_fetch_client().iter_messages(chat, offset_id=offset_id, offset_date=offset_date, max_id=max_id, reverse=True):
+            if max_date is not None and message.date > max_date:
+                break
+            if album and message.grouped_id != album[0].grouped_id:
+                await self._process_album(album, chat, pipeline)
+                album = []
+            if message.grouped_id:
+                album.append(message)
+            else:
+                await self._process_message(message, chat, pipeline)
+        if album:
+            await self._process_album(album, chat, pipeline)
 
-    async def start(self, offset: str, live: bool):
+    def _get_date_range(self, pipeline: Pipeline) -> tuple:
+        lows, highs = [], []
+        for key, tzinfo in ((EventField.DATE, self.tzinfo or timezone.utc), (EventField.DATE_UTC, timezone.utc)):
+            for value, values in zip(pipeline.get_range(key), (lows, highs)):
+                if value is not None:
+                    values.append(value if value.tzinfo else value.replace(tzinfo=tzinfo))
+        return max(lows, default=None), min(highs, default=None)
+
+    async def _enter_takeout(self, stack: contextlib.AsyncExitStack):
+        if self.account.bot_token:
+            logger.warning("%s: takeout session is not available for bots, using normal client", self.account)
+            return self.client
+        if self.client.session.takeout_id is not None:
+            logger.warning("%s: finishing takeout session left by previous run", self.account)
+            try:
+                await self.client.end_takeout(success=False)
+            except tt.errors.RPCError as err:
+                logger.warning("%s: failed to finish previous takeout session (%s)", self.account, err)
+                self.client.session.takeout_id = None
+        takeout = self.client.takeout(
+            finalize=True,
+            users=True,
+            chats=True,
+            megagroups=True,
+            channels=True,
+            files=True,
+            max_file_size=TAKEOUT_MAX_FILE_SIZE,
+        )
+        try:
+            return await stack.enter_async_context(takeout)
+        except tt.errors.TakeoutInitDelayError as err:
+            logger.warning("%s: takeout session is delayed for %s seconds, using normal client", self.account, err.seconds)
+        except (tt.errors.RPCError, ValueError) as err:
+            logger.warning("%s: failed to start takeout session (%s), using normal client", self.account, err)
+        return self.client
+
+    async def _process_history(self, offset: str, takeout: bool = False):
+        async with contextlib.AsyncExitStack() as stack:
+            if takeout:
+                self.history_client = await self._enter_takeout(stack)
+            try:
+                tasks = []
+                async for dialog in self.client.iter_dialogs():
+                    chat_pipeline = await self._get_chat_pipeline(dialog.entity)
+                    if chat_pipeline:
+                        tasks.append(self._process_chat_history(dialog.entity, offset, chat_pipeline))
+                await asyncio.gather(*tasks)
+            finally:
+                self.history_client = None
+
+    async def start(self, offset: str, live: bool, takeout: bool = False):
         logger.info("%s: starting...", self.account)
         await self.client.start(
             phone=self.account.phone,
@@ -128,9 +270,10 @@ class Session:
             bot_token=self.account.bot_token,
         )
         if offset != "now":
-            await self._process_history(offset)
+            await self._process_history(offset, takeout)
         if live:
             self.client.add_event_handler(self._on_message, tt.events.NewMessage)
+            self.client.add_event_handler(self._on_album, tt.events.Album)
 
     async def stop(self):
         logger.info("%s: stopping...", self.account)
@@ -156,14 +299,35 @@ class Session:
                 logger.debug("%s", dialog.entity.stringify())
 
     async def _on_message(self, message):
+        if message.grouped_id:
+            return  # handled by _on_album
         chat, pipeline = await self._get_chat_and_pipeline(message.chat_id)
         if pipeline:
             await self._process_message(message, chat, pipeline)
 
-    async def download_media(self, chat_id: int, message_id: int):
-        message = await self.client.get_messages(chat_id, ids=message_id)
+    async def _on_album(self, album):
+        chat, pipeline = await self._get_chat_and_pipeline(album.chat_id)
+        if pipeline:
+            await self._process_album(album.messages, chat, pipeline)
+
+    async def download_media(self, chat_id: int, message_id: int, on_progress=None):
+        batch = self.message_batches.get((chat_id, message_id))
+        if batch:
+            message = await batch.get(message_id)
+        else:
+            message = await self._get_fetch_client().get_messages(chat_id, ids=message_id)
         download_dir = f"{self.account.workdir}/downloads"
         os.makedirs(download_dir, exist_ok=True)
         download_path = f"{download_dir}/{chat_id}-{message_id}.tmp"
-        progress = lambda current, total: logger.debug(f"Download media {chat_id}/{message_id}: {current}/{total} bytes ({100 * current // total}%)")
-        return await self.client.download_media(message, file=download_path, progress_callback=progress)
+        throttling = Throttling.get()
+        downloaded = 0
+
+        async def progress(current, total):
+            nonlocal downloaded
+            logger.debug(f"Download media {chat_id}/{message_id}: {current}/{total} bytes ({100 * current // total}%)")
+            await throttling.consume(current - downloaded, self.rate_limiter)
+            downloaded = current
+            if on_progress:
+                on_progress(current)
+
+        return await self._get_fetch_client().download_media(message, file=download_path, progress_callback=progress)
@@ -0,0 +1,116 @@
+import asyncio
+import contextlib
+import logging
+import os
+import shutil
+import time
+
+from .utils import parse_size
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate: int, burst: int = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def __repr__(self):
+        return f"TokenBucket: rate={self.rate}, burst={self.capacity}"
+
+    async def consume(self, amount: int):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # tokens are taken immediately, so concurrent consumers wait in turn
+        self.tokens -= amount
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class SpaceReservation:
+    """Disk space reserved for a download, released as the file is written."""
+
+    def __init__(self, reserved: dict[int, int], device: int, size: int):
+        self.reserved = reserved
+        self.device = device
+        self.size = size
+        self.remaining = size
+        self.reserved[device] = self.reserved.get(device, 0) + size
+
+    def update(self, written: int):
+        remaining = max(self.size - written, 0)
+        self.reserved[self.device] -= self.remaining - remaining
+        self.remaining = remaining
+
+    def release(self):
+        self.update(self.size)
+
+
+class DiskGuard:
+    def __init__(self, min_free_space: int, check_interval: float = 60):
+        self.min_free_space = min_free_space
+        self.check_interval = check_interval
+        self.paused_devices = set()
+        # bytes of downloads in progress, which are not written to disk yet
+        self.reserved: dict[int, int] = {}
+
+    def __repr__(self):
+        return f"DiskGuard: min_free_space={self.min_free_space}"
+
+    def _has_space(self, path: str, device: int, size: int) -> bool:
+        free_space = shutil.disk_usage(path).free - self.reserved.get(device, 0)
+        return free_space - size >= self.min_free_space
+
+    @contextlib.asynccontextmanager
+    async def reserve(self, path: str, size: int = 0):
+        size = size or 0
+        device = os.stat(path).st_dev
+        while not self._has_space(path, device, size):
+            if device not in self.paused_devices:
+                self.paused_devices.add(device)
+                logger.warning("Downloads to %s are paused: free space is below %s bytes", path, self.min_free_space)
+            await asyncio.sleep(self.check_interval)
+        if device in self.paused_devices:
+            self.paused_devices.discard(device)
+            logger.info("Downloads to %s are resumed", path)
+        reservation = SpaceReservation(self.reserved, device, size)
+        try:
+            yield reservation
+        finally:
+            reservation.release()
+
+
+class Throttling:
+    instance: "Throttling" = None
+
+    @staticmethod
+    def configure(rate_limit=None, burst=None, min_free_space=None, check_interval: float = 60) -> "Throttling":
+        Throttling.instance = Throttling(
+            rate_limiter=rate_limit and TokenBucket(parse_size(rate_limit), burst and parse_size(burst)),
+            disk_guard=min_free_space and DiskGuard(parse_size(min_free_space), check_interval),
+        )
+        return Throttling.instance
+
+    @staticmethod
+    def get() -> "Throttling":
+        if Throttling.instance is None:
+            Throttling.configure()
+        return Throttling.instance
+
+    def __init__(self, rate_limiter: TokenBucket = None, disk_guard: DiskGuard = None):
+        self.rate_limiter = rate_limiter
+        self.disk_guard = disk_guard
+
+    async def consume(self, amount: int, *rate_limiters: TokenBucket):
+        for rate_limiter in (self.rate_limiter, *rate_limiters):
+            if rate_limiter:
+                await rate_limiter.consume(amount)
+
+    def reserve_space(self, path: str, size: int = 0):
+        if self.disk_guard:
+            return self.disk_guard.reserve(path, size)
+        return contextlib.nullcontext()
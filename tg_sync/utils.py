@@ -16,6 +16,18 @@ def parse_timezone(tz: str):
     date = datetime.strptime(tz, "%z")
     return date.tzinfo
 
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+def parse_size(size) -> int:
+    if isinstance(size, (int, float)):
+        return int(size)
+    value = size.strip().upper().removesuffix("B").removesuffix("I")
+    unit = value[-1:] if value[-1:] in SIZE_UNITS else ""
+    try:
+        return int(float(value.removesuffix(unit)) * SIZE_UNITS[unit])
+    except ValueError:
+        raise ValueError(f"Invalid size: '{size}'") from None
+
 def get_uniq_path(file_path: str) -> str:
     (base, ext) = os.path.splitext(file_path)
     count = 1
@@ -0,0 +1,47 @@
+import asyncio
+import logging
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessPool:
+    instance: "ProcessPool" = None
+
+    @staticmethod
+    def configure(max_workers: int = None, max_pending: int = None) -> "ProcessPool":
+        if ProcessPool.instance:
+            ProcessPool.instance.shutdown()
+        ProcessPool.instance = ProcessPool(max_workers, max_pending)
+        return ProcessPool.instance
+
+    @staticmethod
+    def get() -> "ProcessPool":
+        if ProcessPool.instance is None:
+            ProcessPool.configure()
+        return ProcessPool.instance
+
+    def __init__(self, max_workers: int = None, max_pending: int = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.max_workers
+        self.pending = asyncio.Semaphore(self.max_pending)
+        self.executor = None
+
+    def __repr__(self):
+        return f"ProcessPool: max_workers={self.max_workers}, max_pending={self.max_pending}"
+
+    async def run(self, func, *args):
+        # limit number of submitted jobs, so that events wait here instead of executor queue
+        async with self.pending:
+            if self.executor is None:
+                logger.debug("Starting %s", self)
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None